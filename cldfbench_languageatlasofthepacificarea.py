@@ -6,30 +6,70 @@ import pathlib
 import typing
 import warnings
 import mimetypes
+import itertools
 import collections
+import concurrent.futures
 
 import fiona
+import cldfgeojson
 from pycldf import Sources
 from clldutils.jsonlib import dump, load
 from clldutils.markup import add_markdown_text
 from clldutils.path import TemporaryDirectory, md5
 from cldfbench import Dataset as BaseDataset
 from shapely.geometry import shape
-from shapely import Geometry
+from shapely import Geometry, STRtree
 from cldfgeojson import geotiff
 from cldfgeojson import (
-    MEDIA_TYPE, aggregate, feature_collection, merged_geometry, fixed_geometry, InvalidRingWarning)
+    MEDIA_TYPE, merged_geometry, fixed_geometry, InvalidRingWarning)
 from cldfgeojson.create import shapely_fixed_geometry
 
 from lib.move_polygons import Mover
 from lib.errata import Errata
 from lib.repair_geometry import ReinsertHoles
-from lib.util import existing_dir
+from lib.util import existing_dir, build_option, copy_if_changed
+from lib.cache import BuildCache
+from lib.aggregate import aggregate, LEVELS
+from lib.glottolog import languoids, catalog_version
+from lib.geojson import dump_feature_collection
 from lib import metadata
 
 DC_RIGHTS = "© ECAI Digital Language Atlas of the Pacific Area"
 
 
+def leaf_geotiff(edir: pathlib.Path) -> typing.Optional[pathlib.Path]:
+    for name in ['original_modified.tif', 'epsg4326.tif']:
+        if edir.joinpath(name).exists():
+            return edir / name
+
+
+def warped_leaf(cache_dir: pathlib.Path, leaf: str, epsg4326tif: pathlib.Path) -> pathlib.Path:
+    """
+    Re-project the GeoTIFF of a leaf to web mercator, returning the directory containing the
+    resulting `web.jpg` and `bounds.geojson`.
+
+    Re-projecting is expensive, so we re-use the results as long as neither the GeoTIFF nor the
+    code creating the results - this module and cldfgeojson - changed.
+    """
+    def warped(d):
+        with TemporaryDirectory() as tmp:
+            # 2. create temporary web mercator tif
+            webtif = geotiff.webmercator(epsg4326tif, tmp / 'web.tif')
+            # 3. convert web mercator tif to jpg
+            geotiff.jpeg(webtif, d / 'web.jpg')
+            # 4. store the bounds
+            bounds = geotiff.bounds(webtif)
+            # To make sure we can recreate output idempotently we delete the temp file name in
+            # rio's bounds feature.
+            del bounds['properties']['title']
+            dump(bounds, d / 'bounds.geojson', indent=2)
+
+    return BuildCache(cache_dir).files(
+        'leaves/{}'.format(leaf),
+        [epsg4326tif, pathlib.Path(__file__), cldfgeojson.__version__],
+        warped)
+
+
 class Dataset(BaseDataset):
     dir = pathlib.Path(__file__).parent
     id = "languageatlasofthepacificarea"
@@ -124,22 +164,47 @@ class Dataset(BaseDataset):
 
         assert mover.all_done, 'Not all moves made'
 
+    @property
+    def build_cache(self) -> BuildCache:
+        """
+        Incremental builds - re-using intermediate artifacts of earlier runs if the inputs did not
+        change - are enabled by setting the environment variable `LAOTPA_INCREMENTAL=1`.
+        """
+        return BuildCache(
+            self.dir / '.build_cache', enabled=build_option('incremental', False, bool))
+
     def cmd_makecldf(self, args):
         self.schema(args.writer.cldf)
+        cache = self.build_cache
 
         args.writer.cldf.add_sources(*Sources.from_file(self.etc_dir / "sources.bib"))
 
         # Add scanned Atlas leaves:
         georeferenced = dict(self.iter_leaves(args))
+        # We index the mapped areas of the leaves, to look up leaves intersecting with languoids.
+        leaf_ids, leaf_index = list(georeferenced), STRtree(list(georeferenced.values()))
 
         coded_langs = {
             tuple(v[col] for col in metadata.COLS): v
             for v in self.etc_dir.read_csv('languages.csv', dicts=True) if v.get('Glottocode')}
 
-        polys = []
-        ecai_features = collections.OrderedDict()
+        # The corrected features depend on the shapefile, the errata and the code in this module
+        # and in lib/:
+        inputs = [self.raw_dir / 'languagemap_040102.{}'.format(ext) for ext in ['shp', 'dbf']]
+        inputs.extend(self.etc_dir / name for name in [
+            'fixes_metadata.csv', 'fixes_geometry.geojson', 'fixes_location.csv'])
+        inputs.append(pathlib.Path(__file__))
+        inputs.extend(sorted(self.dir.joinpath('lib').glob('*.py')))
+
+        # Size of the generated GeoJSON can be reduced by rounding coordinates to
+        # `LAOTPA_PRECISION` decimal places and writing compact JSON with `LAOTPA_COMPACT=1`.
+        geojson_options = dict(
+            precision=build_option('precision', None, int),
+            compact=build_option('compact', False, bool))
+
+        polys, ecai_features = [], []
         for lid, lidt, feature in sorted(
-            self.iter_geojson_features(),
+            cache('features', inputs, lambda: list(self.iter_geojson_features())),
             key=lambda i: int(i[0].split('-')[0]) if isinstance(i[0], str) else i[0],
         ):
             args.writer.objects['ContributionTable'].append(dict(
@@ -158,26 +223,61 @@ class Dataset(BaseDataset):
                 feature['properties']['cldf:languageReference'] = gcs
                 for gc in gcs:
                     polys.append((str(lid), feature, gc))
-            ecai_features[lid] = feature
+            feature['id'] = str(lid)
+            ecai_features.append(feature)
+        dump_feature_collection(
+            self.cldf_dir / 'ecai.geojson',
+            ecai_features,
+            **geojson_options,
+            **{'dc:rights': DC_RIGHTS,
+               'dc:title':
+                   'GIS spatial dataset of the ECAI Digital Language Atlas of the Pacific Area'})
+
+        aggregate_options = dict(buffer=0.005, opacity=0.5)
+
+        def aggregated():
+            # Language- and family-level areas are computed in one pass, merging family areas
+            # from language areas.
+            return {
+                level: ([shapely_fixed_geometry(f) for f in features], languages)
+                for level, (features, languages) in aggregate(
+                    polys,
+                    languoids(args.glottolog, self.build_cache.dir),
+                    **aggregate_options).items()}
+
+        def aggregate_inputs():
+            # Computed lazily, because identifying the Glottolog version requires a git clone.
+            version = catalog_version(args.glottolog)
+            if version is None:
+                return None
+            return [
+                polys,
+                version,
+                aggregate_options,
+                pathlib.Path(__file__),
+                self.dir / 'lib' / 'aggregate.py',
+                self.dir / 'lib' / 'glottolog.py']
+
+        aggregates = cache('aggregate', aggregate_inputs, aggregated)
 
         lids = None
-        for ptype in ['language', 'family']:
+        for ptype in LEVELS:
             label = 'languages' if ptype == 'language' else 'families'
             p = self.cldf_dir / '{}.geojson'.format(label)
-            features, languages = aggregate(
-                polys, args.glottolog.api, level=ptype, buffer=0.005, opacity=0.5)
-            dump(feature_collection(
-                [shapely_fixed_geometry(f) for f in features],
+            features, languages = aggregates[ptype]
+            dump_feature_collection(
+                p,
+                features,
+                **geojson_options,
                 title='Speaker areas for {}'.format(label),
                 description='Speaker areas aggregated for Glottolog {}-level languoids, '
-                            'color-coded by family.'.format(ptype)),
-                p,
-                indent=2)
-            for (glang, pids, family), f in zip(languages, features):
-                area = shape(f['geometry'])
-                for cid, ref in georeferenced.items():
-                    if ref.intersects(area):
-                        pids.append(cid)
+                            'color-coded by family.'.format(ptype))
+            leaves = collections.defaultdict(list)
+            for i, j in zip(*leaf_index.query(
+                    [shape(f['geometry']) for f in features], predicate='intersects')):
+                leaves[i].append(j)
+            for i, (glang, pids, family) in enumerate(languages):
+                pids.extend(leaf_ids[j] for j in sorted(leaves[i]))
                 if lids is None or (glang.id not in lids):  # Don't append isolates twice!
                     args.writer.objects['LanguageTable'].append(dict(
                         ID=glang.id,
@@ -200,18 +300,6 @@ class Dataset(BaseDataset):
             ))
             lids = {gl.id for gl, _, _ in languages}
 
-        for lid, feature in ecai_features.items():
-            feature['id'] = str(lid)
-
-        dump(
-            feature_collection(
-                list(ecai_features.values()),
-                **{'dc:rights': DC_RIGHTS,
-                   'dc:title':
-                       'GIS spatial dataset of the ECAI Digital Language Atlas of the Pacific Area'}
-            ),
-            self.cldf_dir / 'ecai.geojson',
-            indent=2)
         args.writer.objects['MediaTable'].append(dict(
             ID='ecai',
             Name='Speaker areas for {}'.format(label),
@@ -228,9 +316,32 @@ class Dataset(BaseDataset):
         For leaves with a defined mapped area, i.e. a polygon describing the area of the map that
         is geo-referenced (leaving out areas covered by the legend or inset maps), the method yields
         the contribution ID of the leaf and a `shapely.Geometry` object describing the area.
+
+        The raster work for the leaves can be distributed over a process pool, by setting the
+        number of worker processes in the environment variable `LAOTPA_WORKERS`.
         """
         atlas_dir = existing_dir(self.cldf_dir / 'atlas')
-        for row in self.raw_dir.read_csv('atlas_leaves.csv', dicts=True):
+        rows = self.raw_dir.read_csv('atlas_leaves.csv', dicts=True)
+        geotiffs = {}
+        for row in rows:
+            tif = leaf_geotiff(self.etc_dir / 'atlas' / row['File'])
+            if tif and self.raw_dir.joinpath('atlas', row['File']).exists():
+                geotiffs[row['File']] = tif
+        workers = build_option('workers', 1, int)
+        if workers > 1:
+            # Functions passed to the pool must be picklable, i.e. defined at module level.
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                rasters = dict(zip(geotiffs, executor.map(
+                    warped_leaf,
+                    itertools.repeat(self.build_cache.dir),
+                    geotiffs,
+                    geotiffs.values())))
+        else:
+            rasters = {
+                leaf: warped_leaf(self.build_cache.dir, leaf, tif)
+                for leaf, tif in geotiffs.items()}
+
+        for row in rows:
             sdir = self.raw_dir / 'atlas' / row['File']
             if not sdir.exists():
                 assert 'Japan' in row['Contents'], 'Non-Japan leaf missing in raw data'
@@ -250,7 +361,7 @@ class Dataset(BaseDataset):
                 p = (edir / name) if type_ == 'points' else (sdir / name)
                 if p.exists():
                     mid = '{}_{}'.format(ldir.name, type_)
-                    shutil.copy(p, ldir / name)
+                    copy_if_changed(p, ldir / name)
                     args.writer.objects['MediaTable'].append(dict(
                         ID=mid,
                         Name='{}/{}'.format(ldir.name, p.name),
@@ -276,12 +387,8 @@ class Dataset(BaseDataset):
                         ldir.joinpath('mapped_area.geojson').relative_to(self.cldf_dir)),
                 ))
                 mids.append('{}_mapped_area'.format(ldir.name))
-            epsg4326tif = edir / 'original_modified.tif'
-            if not epsg4326tif.exists():
-                epsg4326tif = edir / 'epsg4326.tif'
-            if epsg4326tif.exists():
-                p = ldir / 'epsg4326.tif'
-                shutil.copy(epsg4326tif, p)
+            if row['File'] in geotiffs:
+                p = copy_if_changed(geotiffs[row['File']], ldir / 'epsg4326.tif')
                 args.writer.objects['MediaTable'].append(dict(
                     ID='{}_geotiff'.format(ldir.name),
                     Name='{}/{}'.format(ldir.name, p.name),
@@ -290,34 +397,26 @@ class Dataset(BaseDataset):
                     Download_URL=str(p.relative_to(self.cldf_dir)),
                 ))
                 mids.append('{}_geotiff'.format(ldir.name))
-                with TemporaryDirectory() as tmp:
-                    # 2. create temporary web mercator tif
-                    webtif = geotiff.webmercator(epsg4326tif, tmp / 'web.tif')
-                    # 3. convert web mercator tif to jpg
-                    web = geotiff.jpeg(webtif, ldir / 'web.jpg')
-                    args.writer.objects['MediaTable'].append(dict(
-                        ID='{}_web'.format(ldir.name),
-                        Name='{}/{}'.format(ldir.name, web.name),
-                        Description='GeoTIFF re-projected to web mercator and translated to JPEG',
-                        Media_Type='image/jpeg',
-                        Download_URL=str(web.relative_to(self.cldf_dir)),
-                    ))
-                    mids.append('{}_web'.format(ldir.name))
-                    # 4. store the bounds
-                    p = ldir / 'bounds.geojson'
-                    bounds = geotiff.bounds(webtif)
-                    # To make sure we can recreate output idempotently we delete the temp file name
-                    # in rio's bounds feature.
-                    del bounds['properties']['title']
-                    dump(bounds, p, indent=2)
-                    args.writer.objects['MediaTable'].append(dict(
-                        ID='{}_bounds'.format(ldir.name),
-                        Name='{}/{}'.format(ldir.name, p.name),
-                        Description='Bounding box of the scan',
-                        Media_Type='application/geo+json',
-                        Download_URL=str(p.relative_to(self.cldf_dir)),
-                    ))
-                    mids.append('{}_bounds'.format(ldir.name))
+                web = ldir / 'web.jpg'
+                shutil.copy(rasters[row['File']] / web.name, web)
+                args.writer.objects['MediaTable'].append(dict(
+                    ID='{}_web'.format(ldir.name),
+                    Name='{}/{}'.format(ldir.name, web.name),
+                    Description='GeoTIFF re-projected to web mercator and translated to JPEG',
+                    Media_Type='image/jpeg',
+                    Download_URL=str(web.relative_to(self.cldf_dir)),
+                ))
+                mids.append('{}_web'.format(ldir.name))
+                p = ldir / 'bounds.geojson'
+                shutil.copy(rasters[row['File']] / p.name, p)
+                args.writer.objects['MediaTable'].append(dict(
+                    ID='{}_bounds'.format(ldir.name),
+                    Name='{}/{}'.format(ldir.name, p.name),
+                    Description='Bounding box of the scan',
+                    Media_Type='application/geo+json',
+                    Download_URL=str(p.relative_to(self.cldf_dir)),
+                ))
+                mids.append('{}_bounds'.format(ldir.name))
 
             args.writer.objects['ContributionTable'].append(dict(
                 ID=sdir.name,
@@ -1 +1,7 @@
-#
+"""
+Custom cldfbench commands for this dataset, run as `cldfbench laotpa.<module>`.
+
+cldfbench imports all modules of this package to build its CLI. Thus, heavy dependencies -
+shapely, numpy, matplotlib, fiona, mako, PIL and the dataset module itself - must only be imported
+in the functions using them. Use `cldfbench laotpa.importtime` to benchmark the startup time.
+"""
@@ -2,27 +2,107 @@
 Build a set of HTML pages to browse Atlas leaves as interactive leaflet maps.
 """
 import json
+import shutil
 import pathlib
 import webbrowser
+import collections
+import concurrent.futures
 
 from pycldf.media import File
-from clldutils.misc import data_url
-from mako.lookup import TemplateLookup
-
-from cldfbench_languageatlasofthepacificarea import Dataset
+from clldutils.jsonlib import load, dump
+
+from lib.cache import BuildCache
+
+TEMPLATES = pathlib.Path(__file__).parent
+
+
+def register(parser):
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Number of processes to use for rendering leaf pages.')
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        default=False,
+        help='Re-render all leaf pages, even if their input did not change since the last run.')
+
+
+def render(out, tmpl, fname, **vars):
+    from mako.lookup import TemplateLookup
+
+    lookup = TemplateLookup(directories=[str(TEMPLATES)])
+    out.joinpath(fname).write_text(lookup.get_template(tmpl).render(**vars), encoding='utf8')
+
+
+def clipped_features(features, mapped_area, tolerance, margin=0.05):
+    """
+    Clip features to the mapped area of a leaf - plus a margin of `margin` times the extent of
+    the area - and simplify them with the given tolerance.
+    """
+    from shapely import simplify
+    from shapely.geometry import shape
+
+    area = shape(mapped_area)
+    minx, miny, maxx, maxy = area.bounds
+    area = area.buffer(margin * max(maxx - minx, maxy - miny))
+    res = []
+    for f in features:
+        geom = simplify(shape(f['geometry']).intersection(area), tolerance, preserve_topology=True)
+        if not geom.is_empty:
+            res.append(dict(f, geometry=geom.__geo_interface__))
+    return res
+
+
+def render_leaf(out, lid, img, bounds, features, mapped_area, **vars):
+    """
+    Cut the scan of a leaf into tiles and render the leaf page.
+    """
+    from PIL import Image
+
+    from lib.tiles import raster_tiles
+
+    # Speaker areas are only shown with the precision of the scan, i.e. we simplify geometries
+    # with a tolerance of the (longitudinal) size of one pixel.
+    with Image.open(img) as image:
+        tolerance = (bounds[2] - bounds[0]) / image.width
+    features = clipped_features(features, mapped_area, tolerance)
+    # We serve the scan as tile pyramid, so that only the visible tiles must be loaded.
+    tiles = pathlib.Path('tiles') / lid
+    if out.joinpath(tiles).exists():
+        shutil.rmtree(out / tiles)
+    minzoom, maxzoom = raster_tiles(img, bounds, out / tiles)
+    render(
+        out,
+        'leaf.html.mako',
+        '{}.html'.format(lid),
+        tiles=tiles.as_posix(),
+        minzoom=minzoom,
+        maxzoom=maxzoom,
+        lat1=bounds[1],
+        lon1=bounds[0],
+        lat2=bounds[3],
+        lon2=bounds[2],
+        w=4,
+        geojson=json.dumps(dict(type='FeatureCollection', features=features)),
+        **vars)
+    return lid
 
 
 def run(args):
-    lookup = TemplateLookup(directories=[str(pathlib.Path(__file__).parent)])
+    from cldfbench_languageatlasofthepacificarea import Dataset
 
     out = pathlib.Path('language_atlas_of_the_pacific_area')
     if not out.exists():
         out.mkdir()
 
-    def render(tmpl, fname, **vars):
-        out.joinpath(fname).write_text(lookup.get_template(tmpl).render(**vars), encoding='utf8')
+    # We keep track of the inputs of leaf pages, to only re-render pages if necessary.
+    digests_path = out / 'digests.json'
+    digests = load(digests_path) if digests_path.exists() and not args.force else {}
 
-    cldf = Dataset().cldf_reader()
+    ds = Dataset()
+    cldf = ds.cldf_reader()
 
     leaves = {
         l.id: l for l in cldf.objects('ContributionTable') if l.data['Type'] == 'leaf'}
@@ -41,25 +121,28 @@ def run(args):
 
     indexgeojson = {}
     indexleaves = []
-    languages = [
-        l for l in cldf.objects('LanguageTable')
-        if l.data['Glottolog_Languoid_Level'] == 'language']
-    contribs = [
-        {c.id: (c.cldf.name, c.data['Type']) for c in l.all_related('contributionReference')}
-        for l in languages]
-    for lang, contrib in zip(languages, contribs):
-        lgeojson[lang.id]['properties']['shapes'] = sorted(
-            {c[0] for c in contrib.values() if c[1] == 'shape'})
-
-    families = [
-        l for l in cldf.objects('LanguageTable')
-        if l.data['Glottolog_Languoid_Level'] == 'family' or not l.data['Family']]
-    fcontribs = [
-        {c.id: (c.cldf.name, c.data['Type']) for c in l.all_related('contributionReference')}
-        for l in families]
-    for lang, contrib in zip(families, fcontribs):
-        fgeojson[lang.id]['properties']['shapes'] = sorted(
-            {c[0] for c in contrib.values() if c[1] == 'shape'})
+    jobs = {}
+    # We build an inverted index, mapping leaf IDs to the languoids related to the leaf, for
+    # languages and families.
+    contributions = {
+        c.id: (c.cldf.name, c.data['Type']) for c in cldf.objects('ContributionTable')}
+    leaf_languoids = dict(
+        languages=collections.defaultdict(list), families=collections.defaultdict(list))
+    for lang in cldf.objects('LanguageTable'):
+        shapes = sorted({
+            contributions[cid][0] for cid in lang.cldf.contributionReference
+            if contributions[cid][1] == 'shape'})
+        for key, geojson, is_level in [
+            ('languages', lgeojson, lang.data['Glottolog_Languoid_Level'] == 'language'),
+            ('families',
+             fgeojson,
+             lang.data['Glottolog_Languoid_Level'] == 'family' or not lang.data['Family']),
+        ]:
+            if is_level:
+                geojson[lang.id]['properties']['shapes'] = shapes
+                for cid in lang.cldf.contributionReference:
+                    if cid in leaves:
+                        leaf_languoids[key][cid].append(lang)
 
     for lid, leaf in leaves.items():
         img, bounds, mapped = None, None, None
@@ -79,32 +162,47 @@ def run(args):
             id=lid, title=leaf.cldf.name, url='{}.html'.format(lid))
 
         bounds = bounds.read_json()['bbox']
-        langs, features = [], []
         if 'Stocks' in leaf.cldf.name:
-            for lang, contrib in zip(families, fcontribs):
-                if lid in contrib:
-                    features.append(fgeojson[lang.id])
-                    langs.append(lang)
+            langs = leaf_languoids['families'][lid]
+            features = [fgeojson[lang.id] for lang in langs]
         else:
-            for lang, contrib in zip(languages, contribs):
-                if lid in contrib:
-                    features.append(lgeojson[lang.id])
-                    langs.append(lang)
-        render(
-            'leaf.html.mako',
-            '{}.html'.format(lid),
+            langs = leaf_languoids['languages'][lid]
+            features = [lgeojson[lang.id] for lang in langs]
+        job = dict(
+            out=out,
+            lid=lid,
+            img=img.local_path(),
+            bounds=bounds,
             title=leaf.cldf.name,
-            img=data_url(img.read(), 'image/jpeg'),
-            geojson=json.dumps(dict(type='FeatureCollection', features=features)),
-            languages=sorted(langs, key=lambda l: l.cldf.name),
-            lat1=bounds[1],
-            lon1=bounds[0],
-            lat2=bounds[3],
-            lon2=bounds[2],
-            w=4,
+            features=features,
+            mapped_area=indexgeojson[lid]['geometry'],
+            languages=sorted([(l.id, l.cldf.name) for l in langs], key=lambda l: l[1]),
         )
+        # Pages depend on the templates and the code creating them, too.
+        digest = BuildCache.digest(
+            job['img'],
+            *sorted(TEMPLATES.glob('*.mako')),
+            pathlib.Path(__file__),
+            ds.dir / 'lib' / 'tiles.py',
+            [bounds, job['title'], features, job['mapped_area'], job['languages']])
+        if digests.get(lid) != digest \
+                or not out.joinpath('{}.html'.format(lid)).exists() \
+                or not out.joinpath('tiles', lid).exists():
+            jobs[lid] = job
+        digests[lid] = digest
+
+    if args.workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+            for fs in concurrent.futures.as_completed(
+                    [executor.submit(render_leaf, **job) for job in jobs.values()]):
+                args.log.info('rendered {}'.format(fs.result()))
+    else:
+        for job in jobs.values():
+            args.log.info('rendered {}'.format(render_leaf(**job)))
+    dump(digests, digests_path, indent=2)
 
     render(
+        out,
         'index.html.mako',
         'index.html',
         w=3,
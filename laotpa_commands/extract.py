@@ -1,25 +1,28 @@
 """
 input: (name, glottocode) pairs - may also be read from stdin!
+
+Several inputs can be processed in one batch - sharing the Glottolog data and speaker areas loaded
+for all of them - by passing multiple CSV files and/or a manifest file listing one CSV path per
+line. In batch mode, output files are prefixed with the stem of the input file name, e.g.
+`papuan.csv` results in `papuan-paper.geojson`, `papuan-glottolog.geojson` and `papuan-full.geojson`.
 """
 import sys
+import pathlib
 import itertools
+import functools
 import collections
 
-from shapely.geometry import shape, MultiPolygon, box, Point
-from shapely import buffer
-from matplotlib import colormaps
-from matplotlib.colors import rgb2hex
-from pycldf import Dataset
 from pycldf.media import MediaTable
 from csvw.dsv import reader
-from cldfgeojson import MEDIA_TYPE
 from clldutils.jsonlib import dump
+from clldutils.clilib import ParserError, PathType
 from pycldf.cli_util import add_catalog_spec
 
-from cldfbench_languageatlasofthepacificarea import Dataset
+from lib.glottolog import languoids
 
 NAME_COL = 'Name'
 GLOTTOCODE_COL = 'Glottocode'
+OUTPUTS = ['paper', 'glottolog', 'full']
 
 #
 # FIXME: shorten names (remove "(Papua New Guinea)", etc.)
@@ -39,20 +42,79 @@ def register(parser):
     add_catalog_spec(parser, 'glottolog')
     parser.add_argument('--name-column', default=NAME_COL, type=str)
     parser.add_argument('--glottocode-column', default=GLOTTOCODE_COL, type=str)
-    parser.add_argument('input', type=Languages)
+    parser.add_argument(
+        '--manifest',
+        type=PathType(type='file'),
+        default=None,
+        help='Text file listing paths of input CSV files, one per line.')
+    parser.add_argument(
+        '--output-dir',
+        type=PathType(type='dir', must_exist=False),
+        default=pathlib.Path('.'))
+    parser.add_argument('input', nargs='*', help="CSV file or '-' to read from stdin.")
 
 
 def run(args):
-    langs = []
-    try:
-        for d in args.input:
+    inputs = list(args.input)
+    if args.manifest:
+        # Relative paths in the manifest are resolved against the directory of the manifest.
+        inputs.extend(
+            args.manifest.parent / line.strip()
+            for line in args.manifest.read_text(encoding='utf8').split('\n') if line.strip())
+    if not inputs:
+        raise ParserError('No input specified.')
+
+    batch = collections.OrderedDict()
+    for inp in inputs:
+        prefix = '' if len(inputs) == 1 else '{}-'.format(
+            'stdin' if inp == '-' else pathlib.Path(inp).stem)
+        if prefix in batch:
+            raise ParserError('Multiple inputs with the same name: {}'.format(inp))
+        langs = []
+        for d in Languages(inp):
             d[NAME_COL] = d.pop(args.name_column)
             d[GLOTTOCODE_COL] = d.pop(args.glottocode_column)
             langs.append(d)
-    except KeyError:
-        raise
+        batch[prefix] = langs
+
+    from cldfbench_languageatlasofthepacificarea import Dataset
+
     ds = Dataset()
-    _run(args, ds.cldf_reader(), langs)
+    if not args.output_dir.exists():
+        args.output_dir.mkdir(parents=True)
+    _run(args, ds.cldf_reader(), batch)
+
+
+class SpeakerAreas:
+    """
+    Lazy access to the features of the GeoJSON media files of the dataset.
+
+    A GeoJSON file is only read when one of its features is requested, and geometries are only
+    parsed into `shapely` objects - once - when requested.
+    """
+    ID_PROPERTIES = {
+        'languages': lambda f: f['properties']['cldf:languageReference'],
+        'ecai': lambda f: f['id'],
+    }
+
+    def __init__(self, ds):
+        from cldfgeojson import MEDIA_TYPE
+
+        self._media = {f.id: f for f in MediaTable(ds) if f.mimetype == MEDIA_TYPE}
+
+    @functools.lru_cache(maxsize=None)
+    def _features(self, layer):
+        return {
+            self.ID_PROPERTIES[layer](f): f for f in self._media[layer].read_json()['features']}
+
+    def feature(self, layer, fid):
+        return self._features(layer)[fid]
+
+    @functools.lru_cache(maxsize=None)
+    def geometry(self, layer, fid):
+        from shapely.geometry import shape
+
+        return shape(self.feature(layer, fid)['geometry'])
 
 
 def get_classification(lg):
@@ -62,15 +124,17 @@ def get_classification(lg):
     return ('Other', cl[0] if cl else lg.id, cl)
 
 
-def _run(args, ds, langs):
-    classification = {}
-    media = MediaTable(ds)
-    geojson = {f.id: f.read_json() for f in media if f.mimetype == MEDIA_TYPE}
-    geojson_languages = {f['properties']['cldf:languageReference']: f for f in geojson['languages']['features']}
-    geojson_ecai = {f['id']: f for f in geojson['ecai']['features']}
+def _run(args, ds, batch):
+    from shapely.geometry import box, Point
+    from shapely import buffer, contains_xy, prepare, total_bounds
+    from matplotlib import colormaps
+    from matplotlib.colors import rgb2hex
 
-    gl = args.glottolog.api
-    glangs = {l.id: l for l in gl.languoids()}
+    from cldfbench_languageatlasofthepacificarea import Dataset
+
+    areas = SpeakerAreas(ds)
+
+    glangs = languoids(args.glottolog, Dataset().build_cache.dir)
 
     whlangs = {l['Glottocode']: l for l in ds['LanguageTable']}
 
@@ -83,24 +147,40 @@ def _run(args, ds, langs):
     # FIXME: merge whshapes?!
     #
 
-    def get_feature(gc):
+    def lookup(gc):
         # Lookup LanguageTable, and then ContributionTable to collect shapes, then Glottolog for point coordinates.
+        if gc in whlangs:
+            return 'languages', gc
+        if gc in whshapes:
+            assert len(whshapes[gc]) == 1
+            return 'ecai', whshapes[gc][0]['ID']
+        return None, None
+
+    @functools.lru_cache(maxsize=None)
+    def point_area(gc):
+        lg = glangs[gc]
+        # FIXME: make buffer distance configurable!
+        return buffer(Point(lg.longitude, lg.latitude), 0.02)
+
+    def get_geometry(gc):
+        layer, fid = lookup(gc)
+        return areas.geometry(layer, fid) if layer else point_area(gc)
+
+    def get_feature(gc, classification):
         cl = get_classification(glangs[gc])
         classification[gc] = (cl[0], cl[1])
 
-        if gc in whlangs:
-            feature = geojson_languages[gc]
-        elif gc in whshapes:
-            assert len(whshapes[gc]) == 1
-            feature = geojson_ecai[whshapes[gc][0]['ID']]
+        layer, fid = lookup(gc)
+        if layer:
+            # Features are shared between the inputs of a batch, so we must not alter them in-place.
+            feature = areas.feature(layer, fid)
+            feature = dict(feature, properties=dict(feature['properties']))
         else:
-            lg = glangs[gc]
             feature = {
                 'type': 'Feature',
-                # FIXME: make buffer distance configurable!
-                'geometry': buffer(Point(lg.longitude, lg.latitude), 0.02).__geo_interface__,
+                'geometry': point_area(gc).__geo_interface__,
                 'properties': {
-                    'cldf:languageReference': row['Glottocode']
+                    'cldf:languageReference': gc
                 },
             }
         feature['properties'].update(
@@ -111,59 +191,61 @@ def _run(args, ds, langs):
         )
         return feature, cl[2]
 
-    features, gcs = [], set()
-    for row in langs:
-        feature, lineage = get_feature(row['Glottocode'])
-        gcs.add(row['Glottocode'])
-        gcs |= set(lineage)
-        feature['properties'].update(title=row[NAME_COL])
-        features.append(feature)
-
-    bb = MultiPolygon(list(itertools.chain(*[
-        shape(f['geometry']).geoms if isinstance(shape(f['geometry']), MultiPolygon) else [shape(f['geometry'])]
-        for f in features])))
-    boundingbox = buffer(box(*bb.bounds), 0.2)
-
     exclude = {'indo1319', 'pidg1258'}
-    other = []
-    for l in glangs.values():
-        if l.latitude \
-                and l.id not in gcs \
-                and l.level == gl.languoid_levels.language \
-                and ((not l.lineage) or (l.lineage[0][1] not in exclude)):
-            p = Point(l.longitude, l.latitude)
-            if boundingbox.contains(p):
-                features.append(get_feature(l.id)[0])
-                #other.append(get_feature(l.id)[0])
-
-    colors = {}
-    for fam, vals in itertools.groupby(sorted(set(classification.values())), lambda i: i[0]):
-        vals = [v[1] for v in vals]
-
-        for i, v in enumerate(vals, start=1):
-            colors[(fam, v)] = rgb2hex(colormaps['Oranges' if fam == 'Austronesian' else 'Greys'](i / (len(vals) + 1)))
-
-    for f in features:
-        color = colors[(f['properties']['family'], f['properties']['group'])]
-        f['properties'].update({
-            'stroke': '#000',
-            'fill': color,
-            'fill-opacity': 0.9,
-        })
-    dump(dict(type='FeatureCollection', features=features), 'paper.geojson', indent=2)
-
-
-
-
-    for f in other:
-        color = colors[(f['properties']['family'], f['properties']['group'])]
-        f['properties'].update({
-            #'marker-color': color,
-            #'marker-size': 'small',
-            'stroke': '#000',
-            'fill': color,
-            'fill-opacity': 0.9,
-        })
-    dump(dict(type='FeatureCollection', features=other), 'glottolog.geojson', indent=2)
-
-    dump(dict(type='FeatureCollection', features=other + features), 'full.geojson')
+    candidates = [
+        l for l in glangs.values()
+        if l.latitude
+        and l.level == 'language'
+        and ((not l.lineage) or (l.lineage[0][1] not in exclude))]
+    lons, lats = [l.longitude for l in candidates], [l.latitude for l in candidates]
+
+    for prefix, langs in batch.items():
+        classification = {}
+        features, gcs = [], set()
+        for row in langs:
+            feature, lineage = get_feature(row['Glottocode'], classification)
+            gcs.add(row['Glottocode'])
+            gcs |= set(lineage)
+            feature['properties'].update(title=row[NAME_COL])
+            features.append(feature)
+
+        bb = total_bounds([get_geometry(row['Glottocode']) for row in langs])
+        boundingbox = buffer(box(*bb), 0.2)
+
+        other = []
+        # We test all candidate coordinates for containment in one vectorized call:
+        prepare(boundingbox)
+        for l, inside in zip(candidates, contains_xy(boundingbox, lons, lats)):
+            if inside and l.id not in gcs:
+                features.append(get_feature(l.id, classification)[0])
+                #other.append(get_feature(l.id, classification)[0])
+
+        colors = {}
+        for fam, vals in itertools.groupby(sorted(set(classification.values())), lambda i: i[0]):
+            vals = [v[1] for v in vals]
+
+            for i, v in enumerate(vals, start=1):
+                colors[(fam, v)] = rgb2hex(colormaps['Oranges' if fam == 'Austronesian' else 'Greys'](i / (len(vals) + 1)))
+
+        for f in features:
+            color = colors[(f['properties']['family'], f['properties']['group'])]
+            f['properties'].update({
+                'stroke': '#000',
+                'fill': color,
+                'fill-opacity': 0.9,
+            })
+        out = {name: args.output_dir / '{}{}.geojson'.format(prefix, name) for name in OUTPUTS}
+        dump(dict(type='FeatureCollection', features=features), out['paper'], indent=2)
+
+        for f in other:
+            color = colors[(f['properties']['family'], f['properties']['group'])]
+            f['properties'].update({
+                #'marker-color': color,
+                #'marker-size': 'small',
+                'stroke': '#000',
+                'fill': color,
+                'fill-opacity': 0.9,
+            })
+        dump(dict(type='FeatureCollection', features=other), out['glottolog'], indent=2)
+
+        dump(dict(type='FeatureCollection', features=other + features), out['full'])
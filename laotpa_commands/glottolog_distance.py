@@ -1,18 +1,23 @@
 """
 A measure how accurately the shapes of the dataset match the geographic information from Glottolog.
 
-Note: Running this command requires access to the internet because the Glottolog data will be
-downloaded from GitHub.
+The Glottolog coordinates are read from a local clone of glottolog-cldf (`--glottolog-cldf`) or of
+the Glottolog repository (`--glottolog`). If neither is given, the Glottolog CLDF data is
+downloaded from GitHub - which requires access to the internet. The extracted coordinates are
+cached in the build cache of the dataset, so subsequent runs do not need to read the data again.
 """
 import dataclasses
 
-from shapely.geometry import shape
 from clldutils.clilib import PathType
-from clldutils.jsonlib import load
 from pycldf import Dataset as CLDFDataset
+from cldfbench.cli_util import add_catalog_spec, IGNORE_MISSING
 
-from cldfbench_languageatlasofthepacificarea import Dataset
-from .validation import validate, annotate
+from lib.cache import BuildCache
+from lib.glottolog import languoids
+from .validation import add_options, validate, annotate, load_features
+
+GLOTTOLOG_CLDF = \
+    'https://raw.githubusercontent.com/glottolog/glottolog-cldf/v5.0/cldf/cldf-metadata.json'
 
 #
 # The following list of outliers has been checked and described in the paper:
@@ -67,15 +72,53 @@ class GlottologDistance:
 
 
 def register(parser):
-    parser.add_argument('--plot-only', action='store_true', default=False)
+    add_options(parser)
+    add_catalog_spec(parser, 'glottolog', default=IGNORE_MISSING)
+    parser.add_argument(
+        '--glottolog-cldf',
+        type=PathType(type='file'),
+        default=None,
+        help='Path to the metadata file of a local clone of glottolog-cldf.')
+
+
+def glottolog_coordinates(args, cache_dir):
+    """
+    :return: `dict` mapping Glottocodes to (longitude, latitude) pairs.
+    """
+    def from_cldf(md):
+        return {
+            r['id']: (float(r['longitude']), float(r['latitude']))
+            for r in CLDFDataset.from_metadata(md).iter_rows(
+                'LanguageTable', 'id', 'longitude', 'latitude')
+            if r['longitude'] is not None}
+
+    if args.glottolog_cldf:
+        table = CLDFDataset.from_metadata(args.glottolog_cldf)['LanguageTable']
+        return BuildCache(cache_dir)(
+            'glottolog-coordinates',
+            [args.glottolog_cldf, args.glottolog_cldf.parent / str(table.url)],
+            lambda: from_cldf(args.glottolog_cldf))
+    if args.glottolog:
+        return {
+            gc: (lg.longitude, lg.latitude)
+            for gc, lg in languoids(args.glottolog, cache_dir).items()
+            if lg.longitude is not None}
+    return BuildCache(cache_dir)(
+        'glottolog-coordinates', [GLOTTOLOG_CLDF], lambda: from_cldf(GLOTTOLOG_CLDF))
+
 
+def run(args, features=None, gl_coords=None):
+    """
+    :param features: The features of `languages.geojson` as returned by \
+    `validation.load_features`. If not passed, the features are read from the file.
+    :param gl_coords: Glottolog coordinates as returned by `glottolog_coordinates`.
+    """
+    import numpy as np
+    import shapely
+
+    from cldfbench_languageatlasofthepacificarea import Dataset
 
-def run(args):
     ds = Dataset()
-    glottolog = CLDFDataset.from_metadata(
-        'https://raw.githubusercontent.com/glottolog/glottolog-cldf/v5.0/cldf/cldf-metadata.json')
-    gl_coords = {
-        l.id: l.as_geojson_feature for l in glottolog.objects('LanguageTable') if l.cldf.longitude}
 
     with validate(
         args,
@@ -87,25 +130,42 @@ def run(args):
     ) as data:
         if data is None:
             return
-        for f in load(ds.cldf_dir / 'languages.geojson')['features']:
-            gc = f['properties']['cldf:languageReference']
-            if gc in gl_coords:
-                shp = shape(f['geometry'])
-                npolys = len(f['geometry']['coordinates']) \
-                    if f['geometry']['type'] == 'MultiPolygon' else 1
-
-                gl_coord = shape(gl_coords[gc]['geometry'])
-                if shp.contains(gl_coord):
-                    data.append((gc, npolys, True, 0, f['properties']['title']))
-                elif shp.convex_hull.contains(gl_coord):
-                    data.append((gc, npolys, False, 0, f['properties']['title']))
-                else:
-                    dist = shp.distance(gl_coord)
-                    if dist > 180:
-                        dist = abs(dist - 360)
-                    if dist > 2:
-                        assert gc in outliers, 'Unknown outlier: {}'.format(gc)
-                    data.append((gc, npolys, False, dist, f['properties']['title']))
+        if gl_coords is None:
+            gl_coords = glottolog_coordinates(args, ds.build_cache.dir)
+        if features is None:
+            features = load_features(ds.cldf_dir / 'languages.geojson')
+        features = [
+            (props, geom) for props, geom in features
+            if props['cldf:languageReference'] in gl_coords]
+        shps = np.array([geom for _, geom in features], dtype=object)
+        points = shapely.points(
+            [gl_coords[props['cldf:languageReference']] for props, _ in features])
+
+        # We compute containment and distances in bulk, and convex hulls only for the shapes not
+        # containing the Glottolog coordinate.
+        shapely.prepare(shps)
+        contained = shapely.contains(shps, points)
+        misses = np.flatnonzero(~contained)
+        in_hull = dict(zip(
+            misses, shapely.contains(shapely.convex_hull(shps[misses]), points[misses])))
+        outside = [i for i in misses if not in_hull[i]]
+        distances = dict(zip(outside, shapely.distance(shps[outside], points[outside])))
+
+        for i, (props, geom) in enumerate(features):
+            gc = props['cldf:languageReference']
+            npolys = len(geom.geoms) if geom.geom_type == 'MultiPolygon' else 1
+
+            if contained[i]:
+                data.append((gc, npolys, True, 0, props['title']))
+            elif in_hull[i]:
+                data.append((gc, npolys, False, 0, props['title']))
+            else:
+                dist = float(distances[i])
+                if dist > 180:
+                    dist = abs(dist - 360)
+                if dist > 2:
+                    assert gc in outliers, 'Unknown outlier: {}'.format(gc)
+                data.append((gc, npolys, False, dist, props['title']))
 
 
 def _plot(rows, ax):
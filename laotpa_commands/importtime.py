@@ -0,0 +1,54 @@
+"""
+Benchmark the startup time of the laotpa commands.
+
+Since cldfbench imports all laotpa command modules to build its CLI, heavy dependencies (shapely,
+matplotlib, ...) must only be imported when a command is run. This command measures - in fresh
+Python processes - the time to import each command module on top of `cldfbench` and the time to
+run `cldfbench laotpa.<command> -h`.
+"""
+import sys
+import time
+import pkgutil
+import statistics
+import subprocess
+
+from clldutils.clilib import Table, add_format
+
+import laotpa_commands
+
+
+def register(parser):
+    add_format(parser, default='simple')
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=5,
+        help='Number of runs per measurement, reporting the median.')
+
+
+def timed(*args, repeat=5) -> float:
+    res = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable] + list(args),
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL)
+        res.append(time.perf_counter() - start)
+    return statistics.median(res)
+
+
+def run(args):
+    baseline = timed('-c', 'import cldfbench', repeat=args.repeat)
+    with Table(args, 'Command', 'Import [s]', 'Help [s]') as t:
+        t.append(['(import cldfbench)', '{:.3f}'.format(baseline), ''])
+        for mod in sorted(m.name for m in pkgutil.iter_modules(laotpa_commands.__path__)):
+            t.append([
+                mod,
+                '{:.3f}'.format(timed(
+                    '-c', 'import cldfbench, laotpa_commands.{}'.format(mod), repeat=args.repeat)
+                    - baseline),
+                '{:.3f}'.format(timed(
+                    '-m', 'cldfbench', 'laotpa.{}'.format(mod), '-h', repeat=args.repeat)),
+            ])
@@ -7,13 +7,8 @@ from https://www.naturalearthdata.com/downloads/10m-physical-vectors/
 """
 import dataclasses
 
-from shapely import distance
-from shapely.geometry import shape, Point
-from clldutils.jsonlib import load
-import tqdm
-
-from cldfbench_languageatlasofthepacificarea import Dataset
-from .validation import iter_ne_shapes, validate, is_polynesian, is_micronesian
+from .validation import (
+    add_options, ne_index, validate, is_polynesian, is_micronesian, load_features)
 
 
 @dataclasses.dataclass
@@ -38,34 +33,28 @@ class NonIntersectingPolygon:
 
 
 def register(parser):
-    parser.add_argument('--plot-only', action='store_true', default=False)
+    add_options(parser)
 
 
-def iter_polygons(f):
-    if 'Polygon' in f['geometry']['type']:
-        coords = f['geometry']['coordinates'] if f['geometry']['type'] == 'MultiPolygon'\
-            else [f['geometry']['coordinates']]
-        for poly in coords:
-            yield shape(dict(type='Polygon', coordinates=poly))
-    else:  # The reefs shapefile also contains LineStrings.
-        yield shape(f['geometry'])
+def iter_polygons(geom):
+    import shapely
 
+    if geom.geom_type in {'Polygon', 'MultiPolygon'}:
+        yield from shapely.get_parts(geom)
 
-def run(args):
-    ds = Dataset()
 
-    # We store the move target points, because polygons containing one of these are considered
-    # "intersecting".
-    move_targets = []
-    for row in ds.etc_dir.read_csv('fixes_location.csv', dicts=True):
-        if row['target_lat']:
-            move_targets.append(Point(float(row['target_lon']), float(row['target_lat'])))
+def run(args, features=None):
+    """
+    :param features: The features of `ecai.geojson` as returned by `validation.load_features`. \
+    If not passed, the features are read from the file.
+    """
+    import tqdm
+    from shapely import STRtree
+    from shapely.geometry import Point
 
-    # Load NaturalEarth features:
-    ne10 = []
-    for shapefile in ['ne_10m_land', 'ne_10m_reefs']:
-        for shp in iter_ne_shapes(shapefile):
-            ne10.extend(list(iter_polygons(shp)))
+    from cldfbench_languageatlasofthepacificarea import Dataset
+
+    ds = Dataset()
 
     with validate(
         args,
@@ -83,30 +72,49 @@ def run(args):
         if non_intersecting is None:  # we only plot pre-computed results.
             return
 
-        # Loop over corrected, aggregated ECAI shapefile features.
-        for f in tqdm.tqdm(load(ds.cldf_dir / 'ecai.geojson')['features']):
-            for poly in iter_polygons(f):
-                if any(poly.contains(mt) for mt in move_targets):
-                    # Don't check if the polygon contains any target point of a move!
-                    continue
-
-                for ne in ne10:
-                    if ne.intersects(poly):
-                        break
-                else:
-                    if f['properties']['LANGUAGE'] in [  # List of languages that have been cleared:
-                        'Bicoli',
-                        'MAISIN(Uiaku)',
-                        'Logea',  # verified with PNG admin boundaries shapefile
-                    ]:
-                        continue
-                    cent = poly.centroid
-                    non_intersecting.append((
-                        f['properties']['LANGUAGE'],
-                        cent.x,
-                        cent.y,
-                        poly.area,
-                        min(distance(poly, p2) for p2 in ne10)))
+        # We store the move target points, because polygons containing one of these are considered
+        # "intersecting".
+        move_targets = []
+        for row in ds.etc_dir.read_csv('fixes_location.csv', dicts=True):
+            if row['target_lat']:
+                move_targets.append(Point(float(row['target_lon']), float(row['target_lat'])))
+
+        move_targets = STRtree(move_targets)
+
+        # Load NaturalEarth features into a spatial index:
+        ne10 = ne_index('ne_10m_land', 'ne_10m_reefs')
+
+        # Collect the polygons of corrected, aggregated ECAI shapefile features.
+        polys = []
+        if features is None:
+            features = load_features(ds.cldf_dir / 'ecai.geojson')
+        for props, geom in tqdm.tqdm(features):
+            if props['LANGUAGE'] in [  # List of languages that have been cleared:
+                'Bicoli',
+                'MAISIN(Uiaku)',
+                'Logea',  # verified with PNG admin boundaries shapefile
+            ]:
+                continue
+            for poly in iter_polygons(geom):
+                polys.append((props['LANGUAGE'], poly))
+
+        # Don't check polygons containing any target point of a move!
+        moved = set(move_targets.query([p for _, p in polys], predicate='contains')[0])
+        polys = [p for i, p in enumerate(polys) if i not in moved]
+
+        # Bulk-query the index for polygons intersecting with any land mass ...
+        intersecting = set(ne10.query([p for _, p in polys], predicate='intersects')[0])
+        polys = [p for i, p in enumerate(polys) if i not in intersecting]
+        # ... and compute the distance to the nearest land mass for the others.
+        (indices, _), distances = ne10.query_nearest(
+            [p for _, p in polys], return_distance=True)
+        mindist = {}
+        for i, dist in zip(indices, distances):  # There may be multiple nearest features.
+            mindist[i] = min(mindist.get(i, dist), dist)
+
+        for i, (language, poly) in enumerate(polys):
+            cent = poly.centroid
+            non_intersecting.append((language, cent.x, cent.y, poly.area, float(mindist[i])))
 
 
 def _plot(nips, ax):
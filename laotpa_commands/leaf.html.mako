@@ -35,9 +35,9 @@
             </tr>
             </thead>
             <tbody>
-            % for lang in languages:
+            % for lid, name in languages:
             <tr>
-                <td><a onclick="highlight(`${lang.id}`)">${lang.cldf.name}</a></td>
+                <td><a onclick="highlight(`${lid}`)">${name}</a></td>
             </tr>
             % endfor
             </tbody>
@@ -93,9 +93,12 @@
             maxZoom: 18,
             attribution:'&copy; <a href="http://openstreetmap.org/copyright">OpenStreetMap</a> contributors'}
     ).addTo(map);
-    const imageOverlay = L.imageOverlay('${img}', latLngBounds, {
-        opacity: 0.5,
-        interactive: true
+    const imageOverlay = L.tileLayer('${tiles}/{z}/{x}/{y}.webp', {
+        bounds: latLngBounds,
+        minNativeZoom: ${minzoom},
+        maxNativeZoom: ${maxzoom},
+        maxZoom: 18,
+        opacity: 0.5
     }).addTo(map);
     if (langs) {
         polygons = L.geoJSON(langs, {onEachFeature: onEachFeature}).addTo(map);
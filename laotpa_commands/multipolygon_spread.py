@@ -8,25 +8,28 @@ deviation for the distances between polygons for this language.
 """
 import typing
 import pathlib
-import itertools
-import statistics
 import dataclasses
 
-from shapely.geometry import shape, Polygon
-from shapely import distance
-from cldfbench_languageatlasofthepacificarea import Dataset
-from clldutils.jsonlib import load, dump
-from cldfgeojson import feature_collection, Feature
-from tqdm import tqdm
+from clldutils.jsonlib import dump
 
-from .validation import iter_ne_shapes, validate, is_micronesian, is_polynesian, annotate
+from .validation import (
+    add_options, ne_index, validate, is_micronesian, is_polynesian, annotate, load_features)
 
+if typing.TYPE_CHECKING:  # pragma: no cover
+    from shapely.geometry import MultiPolygon, Polygon
 
-def spread(f: Feature) -> typing.Tuple[float, typing.List[Polygon]]:
-    assert f['geometry']['type'] == 'MultiPolygon'
-    polys = [shape(dict(type='Polygon', coordinates=poly)) for poly in f['geometry']['coordinates']]
+
+def spread(geom: 'MultiPolygon') -> typing.Tuple[float, typing.List['Polygon']]:
+    import numpy as np
+    from shapely import distance
+
+    assert geom.geom_type == 'MultiPolygon'
+    polys = list(geom.geoms)
     if len(polys) > 2:
-        dist = statistics.stdev(p1.distance(p2) for p1, p2 in itertools.combinations(polys, 2))
+        # Compute the distances for all pairs of polygons in one vectorized call:
+        i, j = np.triu_indices(len(polys), k=1)
+        arr = np.array(polys, dtype=object)
+        dist = float(np.std(distance(arr[i], arr[j]), ddof=1))
     elif len(polys) == 2:
         dist = polys[0].distance(polys[1])
     else:
@@ -48,12 +51,21 @@ class PolygonSpread:
 
 
 def register(parser):
-    parser.add_argument('--plot-only', action='store_true', default=False)
+    add_options(parser)
+
+
+def run(args, features=None):
+    """
+    :param features: The features of `languages.geojson` as returned by \
+    `validation.load_features`. If not passed, the features are read from the file.
+    """
+    import numpy as np
+    from tqdm import tqdm
+    from cldfgeojson import feature_collection
 
+    from cldfbench_languageatlasofthepacificarea import Dataset
 
-def run(args):
     ds = Dataset()
-    ne10 = [shape(shp['geometry']) for shp in iter_ne_shapes('ne_10m_ocean')]
     spread_out = []
 
     with validate(
@@ -72,13 +84,16 @@ def run(args):
     ) as data:
         if data is None:
             return
-        for f in tqdm(load(ds.cldf_dir / 'languages.geojson')['features']):
-            if f['geometry']['type'] == 'MultiPolygon':
-                mdist, polys = spread(f)
+        ocean = ne_index('ne_10m_ocean')
+        if features is None:
+            features = load_features(ds.cldf_dir / 'languages.geojson')
+        for props, geom in tqdm(features):
+            if geom.geom_type == 'MultiPolygon':
+                mdist, polys = spread(geom)
                 if not mdist:
                     continue
                 if mdist > 14:
-                    assert f['properties']['title'] in [
+                    assert props['title'] in [
                         'Tuvalu',  # Crosses the antimeridian.
                         'Mangaia-Old Rapa',
                     ]
@@ -87,18 +102,19 @@ def run(args):
                     if not coastal:
                         coastal = all(is_micronesian(p) for p in polys)
                     if not coastal:
-                        coastal = all(
-                            min(0 if p.intersects(l) else distance(p, l)
-                                for l in ne10) < 0.005 for p in polys)  # ~< 500m
+                        # All polygons must be within ~500m of the ocean:
+                        hits = ocean.query(polys, predicate='dwithin', distance=0.005)
+                        coastal = len(np.unique(hits[0])) == len(polys)
                     data.append((
-                        f['properties']['cldf:languageReference'],
+                        props['cldf:languageReference'],
                         len(polys),
                         mdist,
                         coastal,
-                        f['properties']['title']
+                        props['title']
                     ))
                     if mdist > 2:
-                        spread_out.append(f)
+                        spread_out.append(
+                            dict(type='Feature', properties=props, geometry=geom.__geo_interface__))
 
                         # Mandar: OK, coastal language in Sulawesi
                         # Tavoyan: OK, coastal language in Myanmar
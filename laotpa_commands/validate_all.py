@@ -0,0 +1,59 @@
+"""
+Run all validation commands, i.e. landmass_distance, multipolygon_spread and glottolog_distance.
+
+The GeoJSON files of the dataset are read only once, and the metrics are computed concurrently in
+separate processes, writing the same outputs as the individual commands.
+"""
+import argparse
+import concurrent.futures
+
+from . import landmass_distance, multipolygon_spread, glottolog_distance
+from .validation import load_features, features_to_wkb, features_from_wkb
+
+
+def register(parser):
+    # This adds the plot options and the options to specify the Glottolog data source:
+    glottolog_distance.register(parser)
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=3,
+        help='Number of processes to use for computing the metrics.')
+
+
+def _run_metric(func, svg, properties, wkb, **kw):
+    # Geometries are passed between processes as WKB, which is much cheaper to (de)serialize than
+    # GeoJSON.
+    func(
+        argparse.Namespace(plot_only=False, svg=svg),
+        features=features_from_wkb(properties, wkb),
+        **kw)
+
+
+def run(args):
+    metrics = [
+        (landmass_distance.run, 'ecai'),
+        (multipolygon_spread.run, 'languages'),
+        (glottolog_distance.run, 'languages'),
+    ]
+    if args.plot_only:
+        # Plotting pre-computed results is cheap, so we don't need to load any data.
+        for func, _ in metrics:
+            func(args)
+        return
+
+    from cldfbench_languageatlasofthepacificarea import Dataset
+
+    ds = Dataset()
+    features = {
+        name: features_to_wkb(load_features(ds.cldf_dir / '{}.geojson'.format(name)))
+        for name in sorted(set(name for _, name in metrics))}
+    kw = {glottolog_distance.run: dict(
+        gl_coords=glottolog_distance.glottolog_coordinates(args, ds.build_cache.dir))}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(_run_metric, func, args.svg, *features[name], **kw.get(func, {}))
+            for func, name in metrics]
+        for future in futures:
+            future.result()  # Re-raise exceptions from the worker processes.
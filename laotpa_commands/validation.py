@@ -1,18 +1,23 @@
 """
 Validation of the data in this dataset is split into several commands.
 """
+import typing
 import pathlib
 import contextlib
 import dataclasses
 
-import fiona
-from shapely.geometry import Polygon
-import matplotlib.pyplot as plt
-import matplotlib.patches as mpatches
 from csvw.dsv import reader, UnicodeWriter
+from clldutils.jsonlib import load
+
+from lib.cache import BuildCache
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    import shapely
 
 
 def get_lon_lat(arg):
+    from shapely.geometry import Polygon
+
     if isinstance(arg, tuple):
         assert len(arg) == 2
         return arg
@@ -31,6 +36,18 @@ def is_micronesian(arg):
     return lon > 130 and lat > 1
 
 
+def add_options(parser):
+    """
+    Add the options shared by all validation commands.
+    """
+    parser.add_argument('--plot-only', action='store_true', default=False)
+    parser.add_argument(
+        '--svg',
+        action='store_true',
+        default=False,
+        help='Save the plot in SVG format in addition to PNG.')
+
+
 @contextlib.contextmanager
 def validate(args, ds, f, item_class, plot_func, plot_args, plot_kw=None):
     data = Data(ds, f, item_class)
@@ -41,7 +58,10 @@ def validate(args, ds, f, item_class, plot_func, plot_args, plot_kw=None):
             data.write()
         assert data.path.exists()
         with plot(
-            data.path.parent / '{}.png'.format(data.path.stem), *plot_args, **plot_kw or {}
+            data.path.parent / '{}.png'.format(data.path.stem),
+            *plot_args,
+            formats=['png', 'svg'] if getattr(args, 'svg', False) else ['png'],
+            **plot_kw or {}
         ) as ax:
             plot_func(data.read(), ax)
 
@@ -66,10 +86,19 @@ class Data:
 
 
 @contextlib.contextmanager
-def plot(fname, title, xlabel, ylabel, legend_loc='upper left', legend_items=None):
-    fig, ax = plt.subplots()
-    fig.set_figheight(8)
-    fig.set_figwidth(10)
+def plot(fname, title, xlabel, ylabel, legend_loc='upper left', legend_items=None, formats=None):
+    """
+    Plots are rendered headless, i.e. we use matplotlib's object-oriented API with the default
+    Agg canvas rather than `pyplot`, thus no GUI backend is imported and nothing blocks.
+
+    :param formats: List of file formats to save the plot in, with `fname` determining the file \
+    name stem (default: the suffix of `fname`).
+    """
+    from matplotlib.figure import Figure  # Importing matplotlib is slow, so we do it lazily.
+    from matplotlib.patches import Patch
+
+    fig = Figure(figsize=(10, 8))
+    ax = fig.subplots()
     try:
         yield ax
     finally:
@@ -78,13 +107,13 @@ def plot(fname, title, xlabel, ylabel, legend_loc='upper left', legend_items=Non
         ax.set_title(title)
         if legend_items:
             ax.legend(
-                handles=[mpatches.Patch(color=c, label=l) for c, l in legend_items.items()],
+                handles=[Patch(color=c, label=l) for c, l in legend_items.items()],
                 loc=legend_loc,
                 fontsize=14)
         ax.grid(True)
         fig.tight_layout()
-        plt.savefig(str(fname))
-        plt.show()
+        for fmt in formats or [fname.suffix[1:]]:
+            fig.savefig(str(fname.with_suffix('.' + fmt)))
 
 
 def annotate(ax, text, xy):
@@ -97,9 +126,68 @@ def annotate(ax, text, xy):
     )
 
 
+NE_DIR = pathlib.Path(__file__).parent / 'naturalearth'
+
+
 def iter_ne_shapes(shapefile):
-    yield from fiona.open(
-        str(pathlib.Path(__file__).parent / 'naturalearth' / '{}.shp'.format(shapefile)))
+    import fiona
+
+    yield from fiona.open(str(NE_DIR / '{}.shp'.format(shapefile)))
+
+
+def ne_geometries(shapefile) -> list:
+    """
+    Read the geometries of a NaturalEarth shapefile as list of `shapely.Geometry` objects.
+
+    Since parsing the large scale shapefiles is slow, geometries are cached as WKB in
+    `naturalearth/<shapefile>.pickle`, keyed by size and modification time of the shapefile.
+    """
+    import shapely
+    from shapely.geometry import shape
+
+    shp = NE_DIR / '{}.shp'.format(shapefile)
+    wkb = BuildCache(NE_DIR)(
+        shapefile,
+        [shp.stat().st_size, shp.stat().st_mtime_ns],
+        lambda: list(shapely.to_wkb([shape(f['geometry']) for f in iter_ne_shapes(shapefile)])))
+    return list(shapely.from_wkb(wkb))
+
+
+def ne_index(*shapefiles) -> 'shapely.STRtree':
+    """
+    A spatial index over the individual parts (i.e. polygons or lines) of the geometries of
+    NaturalEarth shapefiles.
+    """
+    import shapely
+
+    return shapely.STRtree(shapely.get_parts([g for s in shapefiles for g in ne_geometries(s)]))
+
+
+def load_features(path: pathlib.Path) -> typing.List[typing.Tuple[dict, 'shapely.Geometry']]:
+    """
+    Read the features of a GeoJSON file as (properties, geometry) pairs.
+    """
+    from shapely.geometry import shape
+
+    return [
+        (f['properties'], shape(f['geometry']))
+        for f in load(path)['features']]
+
+
+def features_to_wkb(features) -> typing.Tuple[list, list]:
+    """
+    Serialize (properties, geometry) pairs as returned by `load_features` to a pair (list of
+    properties, list of WKB), which can be passed to other processes cheaply.
+    """
+    import shapely
+
+    return [props for props, _ in features], list(shapely.to_wkb([g for _, g in features]))
+
+
+def features_from_wkb(properties, wkb) -> typing.List[typing.Tuple[dict, 'shapely.Geometry']]:
+    import shapely
+
+    return list(zip(properties, shapely.from_wkb(wkb)))
 
 
 def run(args):
@@ -0,0 +1,151 @@
+"""
+Export the speaker areas of the dataset as Mapbox Vector Tiles (MVT), to be used with web maps.
+
+Tiles are written to a single MBTiles file (an SQLite database) or to a directory of
+`<z>/<x>/<y>.pbf` files. Geometries are simplified per zoom level, to the size of one pixel.
+
+Note: Running this command requires the `mapbox-vector-tile` package, which can be installed
+via `pip install -e .[vectortiles]`.
+"""
+import gzip
+import json
+import math
+import shutil
+import sqlite3
+import collections
+
+from clldutils.clilib import ParserError, PathType
+from clldutils.jsonlib import load
+
+from lib.util import existing_dir
+
+LAYERS = ['languages', 'families', 'ecai']
+EXTENT = 4096
+BUFFER = 64 / EXTENT  # Features are clipped to the tile plus a buffer, to avoid seams.
+
+
+def register(parser):
+    parser.add_argument(
+        'output',
+        type=PathType(must_exist=False),
+        help='Path of the MBTiles file or - with "--format directory" - the tile directory.')
+    parser.add_argument(
+        '--format',
+        choices=['mbtiles', 'directory'],
+        default='mbtiles')
+    parser.add_argument(
+        '--layer',
+        choices=LAYERS,
+        action='append',
+        default=[],
+        help='GeoJSON file to include as layer (default: all).')
+    parser.add_argument('--minzoom', type=int, default=0)
+    parser.add_argument('--maxzoom', type=int, default=8)
+
+
+def mvt_properties(props):
+    # MVT only supports scalar property values.
+    return {
+        k: ' '.join(v) if isinstance(v, list) else v for k, v in props.items()
+        if v is not None and not isinstance(v, dict)}
+
+
+def iter_tiles(layers, minzoom, maxzoom):
+    """
+    :param layers: `dict` mapping layer names to lists of (properties, projected geometry) pairs.
+    :return: Generator of (z, x, y, tile) tuples, where tile is a `dict` mapping layer names to \
+    lists of features clipped to the tile.
+    """
+    import shapely
+
+    from lib.tiles import TILE_SIZE, tile_bounds
+
+    for z in range(minzoom, maxzoom + 1):
+        n = 2 ** z
+        tiles = collections.defaultdict(lambda: collections.defaultdict(list))
+        for name, features in layers.items():
+            geoms = shapely.simplify(
+                [g for _, g in features], 1 / (n * TILE_SIZE), preserve_topology=True)
+            for (props, _), geom in zip(features, geoms):
+                minx, miny, maxx, maxy = geom.bounds
+                for x in range(math.floor(minx * n), min(math.ceil(maxx * n), n)):
+                    for y in range(
+                            max(math.floor((1 - maxy) * n), 0), min(math.ceil((1 - miny) * n), n)):
+                        x1, y1, x2, y2 = tile_bounds(z, x, y)
+                        clipped = shapely.clip_by_rect(
+                            geom,
+                            x1 - BUFFER / n, y1 - BUFFER / n, x2 + BUFFER / n, y2 + BUFFER / n)
+                        if not clipped.is_empty:
+                            tiles[(x, y)][name].append(dict(geometry=clipped, properties=props))
+        for (x, y), tile in sorted(tiles.items()):
+            yield z, x, y, tile
+
+
+def run(args):
+    try:
+        import mapbox_vector_tile
+    except ImportError:  # pragma: no cover
+        raise ParserError('This command requires the mapbox-vector-tile package.')
+    from tqdm import tqdm
+    from shapely.geometry import shape
+
+    from cldfbench_languageatlasofthepacificarea import Dataset
+    from lib.tiles import mercator_geometry, tile_bounds
+
+    if args.output.exists() and args.output.is_dir() != (args.format == 'directory'):
+        raise ParserError('{} is not a {}'.format(
+            args.output, 'directory' if args.format == 'directory' else 'file'))
+
+    ds = Dataset()
+    layers, bounds = {}, None
+    for name in args.layer or LAYERS:
+        layers[name] = []
+        for f in load(ds.cldf_dir / '{}.geojson'.format(name))['features']:
+            geom = shape(f['geometry'])
+            bounds = geom.bounds if bounds is None else (
+                min(bounds[0], geom.bounds[0]),
+                min(bounds[1], geom.bounds[1]),
+                max(bounds[2], geom.bounds[2]),
+                max(bounds[3], geom.bounds[3]))
+            layers[name].append((mvt_properties(f['properties']), mercator_geometry(geom)))
+
+    if args.format == 'mbtiles':
+        if args.output.exists():
+            args.output.unlink()
+        db = sqlite3.connect(str(args.output))
+        db.execute('CREATE TABLE metadata (name text, value text)')
+        db.execute(
+            'CREATE TABLE tiles '
+            '(zoom_level integer, tile_column integer, tile_row integer, tile_data blob)')
+        db.execute(
+            'CREATE UNIQUE INDEX tile_index on tiles (zoom_level, tile_column, tile_row)')
+        db.executemany('INSERT INTO metadata VALUES (?, ?)', [
+            ('name', ds.metadata.title),
+            ('format', 'pbf'),
+            ('minzoom', str(args.minzoom)),
+            ('maxzoom', str(args.maxzoom)),
+            ('bounds', ','.join(str(c) for c in bounds)),
+            ('json', json.dumps({'vector_layers': [
+                {'id': name, 'fields': {}, 'minzoom': args.minzoom, 'maxzoom': args.maxzoom}
+                for name in layers]})),
+        ])
+    else:
+        if args.output.exists():  # Remove tiles from previous runs.
+            shutil.rmtree(args.output)
+        db = None
+
+    for z, x, y, tile in tqdm(iter_tiles(layers, args.minzoom, args.maxzoom)):
+        data = mapbox_vector_tile.encode(
+            [dict(name=name, features=features) for name, features in tile.items()],
+            default_options=dict(quantize_bounds=tile_bounds(z, x, y), extents=EXTENT))
+        if db:
+            # MBTiles use the TMS tiling scheme, i.e. rows are counted from the south.
+            db.execute(
+                'INSERT INTO tiles VALUES (?, ?, ?, ?)',
+                (z, x, 2 ** z - 1 - y, gzip.compress(data)))
+        else:
+            existing_dir(args.output / str(z) / str(x)).joinpath('{}.pbf'.format(y)).write_bytes(
+                data)
+    if db:
+        db.commit()
+        db.close()
@@ -0,0 +1,98 @@
+"""
+Aggregation of ECAI shapes into speaker areas for Glottolog languages and families.
+
+This re-implements `cldfgeojson.aggregate` for both levels in one pass: Family-level areas are
+merged from the already merged language-level areas (plus shapes mapped to subgroups or families
+directly), rather than from all individual shapes again.
+"""
+import typing
+import collections
+
+from clldutils.color import qualitative_colors
+from cldfgeojson import merged_geometry
+
+from .glottolog import Languoid
+
+LEVELS = ['language', 'family']
+
+
+def aggregate(shapes: typing.Iterable[typing.Tuple[str, dict, str]],
+              glangs: typing.Dict[str, Languoid],
+              buffer: float = 0.001,
+              opacity: float = 0.8) -> typing.Dict[str, typing.Tuple[list, list]]:
+    """
+    :param shapes: Iterable of (feature ID, GeoJSON feature, Glottocode) triples.
+    :param glangs: `dict` mapping Glottocodes to `Languoid` objects.
+    :return: `dict` mapping levels to pairs (features, languoids) as returned by \
+    `cldfgeojson.aggregate`.
+    """
+    lang2fam = {}  # Maps glottocodes of mapped languoids to top-level families.
+    # Aggregates polygons per mapped glottocode, together with the Glottocode of the language
+    # containing the mapped languoid (if any).
+    polys_by_code = collections.defaultdict(list)
+
+    for pid, feature, gc in shapes:
+        glang = glangs[gc]
+        lineage = [lin[1] for lin in glang.lineage]
+        language = None
+        for lgc in [gc] + list(reversed(lineage)):  # Dialects are aggregated with their language.
+            if glangs[lgc].level == 'language':
+                language = lgc
+                break
+        polys_by_code[gc].append((pid, feature, language))
+        if lineage:
+            for fgc in lineage:
+                lang2fam[fgc] = lineage[0]
+                polys_by_code[fgc].append((pid, feature, language))
+            lang2fam[glang.id] = lineage[0]
+        else:
+            lang2fam[glang.id] = glang.id
+
+    colors = dict(zip(
+        [k for k, v in collections.Counter(lang2fam.values()).most_common()],
+        qualitative_colors(len(lang2fam.values()))))
+
+    def feature(gc, geometry):
+        return dict(
+            type="Feature",
+            properties={
+                'title': glangs[gc].name,
+                'fill': colors[lang2fam[gc]],
+                'family': glangs[lang2fam[gc]].name if lang2fam[gc] != gc else None,
+                'cldf:languageReference': gc,
+                'fill-opacity': opacity},
+            geometry=geometry)
+
+    def languoid(gc):
+        return (
+            glangs[gc],
+            [p[0] for p in polys_by_code[gc]],
+            glangs[lang2fam[gc]].name if lang2fam[gc] != gc else None)
+
+    res, areas = {}, {}
+    language_codes = {
+        gc for gc in polys_by_code if glangs[gc].level == 'language'}
+    for level, gcs in [
+        ('language', sorted(language_codes)),
+        ('family', sorted(set(lang2fam.values()))),
+    ]:
+        languoids, features = [], []
+        for gc in gcs:
+            if level == 'language':
+                geoms = [p[1] for p in polys_by_code[gc]]
+            else:
+                # We merge the areas of the languages with the shapes which are not part of any
+                # language area:
+                geoms, langs = [], set()
+                for _, f, language in polys_by_code[gc]:
+                    if language is None:
+                        geoms.append(f)
+                    elif language not in langs:
+                        langs.add(language)
+                        geoms.append(areas[language])
+            languoids.append(languoid(gc))
+            features.append(feature(gc, merged_geometry(geoms, buffer=buffer)))
+            if level == 'language':
+                areas[gc] = features[-1]['geometry']
+        res[level] = (features, languoids)
+    return res
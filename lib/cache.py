@@ -0,0 +1,96 @@
+"""
+Support for incremental runs of `makecldf`.
+
+Intermediate artifacts of the stages of the CLDF creation are stored on disk, together with a
+digest of the inputs of the stage. If the inputs didn't change, the stored artifact is re-used.
+"""
+import json
+import shutil
+import pickle
+import typing
+import hashlib
+import pathlib
+
+from .util import existing_dir
+
+
+class BuildCache:
+    """
+    Only the artifact of the latest run of a stage is kept, in `<dir>/<stage>.pickle`.
+    """
+    def __init__(self, d: pathlib.Path, enabled: bool = True):
+        self.dir = d
+        self.enabled = enabled
+
+    @staticmethod
+    def digest(*inputs) -> str:
+        """
+        Compute a digest over the inputs of a stage.
+
+        :param inputs: `pathlib.Path` objects are hashed by file content, all other objects \
+        by their JSON serialization.
+        """
+        md5 = hashlib.md5()
+        for inp in inputs:
+            if isinstance(inp, pathlib.Path):
+                md5.update(inp.name.encode('utf8'))
+                with inp.open('rb') as fp:
+                    for chunk in iter(lambda: fp.read(2 ** 20), b''):
+                        md5.update(chunk)
+            else:
+                md5.update(json.dumps(inp, sort_keys=True).encode('utf8'))
+        return md5.hexdigest()
+
+    def __call__(self,
+                 stage: str,
+                 inputs: typing.Union[list, typing.Callable[[], typing.Optional[list]]],
+                 func: typing.Callable[[], typing.Any]):
+        """
+        Return the artifact of `stage` for `inputs`, computing it by calling `func` if necessary.
+
+        :param inputs: List of inputs or a callable returning the list - to defer computing \
+        inputs which are expensive or may fail until the cache is actually used. If the callable \
+        returns `None`, the inputs cannot be identified and the cache is bypassed.
+        """
+        if not self.enabled:
+            return func()
+        if callable(inputs):
+            inputs = inputs()
+            if inputs is None:
+                return func()
+        key = self.digest(*inputs)
+        p = self.dir / '{}.pickle'.format(stage)
+        if p.exists():
+            try:
+                with p.open('rb') as fp:
+                    cached_key, res = pickle.load(fp)
+                if cached_key == key:
+                    return res
+            except (pickle.UnpicklingError, EOFError, ValueError, TypeError):  # Corrupt file.
+                pass
+        res = func()
+        # We write to a temporary file first, so that an interrupted run doesn't leave a corrupt
+        # cache file.
+        tmp = existing_dir(self.dir) / '{}.pickle.tmp'.format(stage)
+        with tmp.open('wb') as fp:
+            pickle.dump((key, res), fp)
+        tmp.replace(p)
+        return res
+
+    def files(self, stage: str, inputs: list, func: typing.Callable[[pathlib.Path], None]) \
+            -> pathlib.Path:
+        """
+        Return a directory containing the file artifacts of `stage` for `inputs`, calling `func`
+        with the directory as argument to create the files if necessary.
+
+        Since file artifacts are content-addressed and can be re-used byte-for-byte, they are
+        cached irrespective of `enabled`.
+        """
+        d = self.dir / stage / self.digest(*inputs)
+        if not d.exists():
+            if d.parent.exists():
+                shutil.rmtree(d.parent)
+            tmp = existing_dir(d.parent / 'tmp')
+            func(tmp)
+            tmp.rename(d)
+        return d
@@ -0,0 +1,65 @@
+"""
+Writing GeoJSON files.
+"""
+import typing
+import warnings
+import pathlib
+
+import shapely
+from shapely.geometry import shape
+from clldutils.jsonlib import dump
+from cldfgeojson import feature_collection
+
+
+def rounded_geometry(geometry: dict, precision: int) -> dict:
+    """
+    Round the coordinates of a GeoJSON geometry to `precision` decimal places.
+
+    If rounding results in an invalid geometry (e.g. because of collapsing rings), the geometry
+    is snapped to the precision grid with `shapely.set_precision`, which preserves validity. If
+    the geometry collapses completely - e.g. for slivers smaller than the precision - it is kept
+    unrounded.
+    """
+    def rounded(coords):
+        if coords and isinstance(coords[0], (int, float)):
+            return [round(c, precision) for c in coords]
+        return [rounded(c) for c in coords]
+
+    if 'coordinates' not in geometry:
+        return geometry  # pragma: no cover
+    res = dict(geometry, coordinates=rounded(geometry['coordinates']))
+    if not shape(res).is_valid:
+        snapped = shapely.set_precision(shape(geometry), 10 ** -precision)
+        if snapped.is_empty:
+            warnings.warn(
+                'Geometry collapses when rounded to {} decimal places, keeping it unrounded'.format(
+                    precision))
+            return geometry
+        snapped = snapped.__geo_interface__
+        res = dict(snapped, coordinates=rounded(snapped['coordinates']))
+        if not shape(res).is_valid:  # pragma: no cover
+            warnings.warn('Geometry invalid when rounded, keeping it unrounded')
+            return geometry
+    return res
+
+
+def dump_feature_collection(path: pathlib.Path,
+                            features: typing.List[dict],
+                            precision: typing.Optional[int] = None,
+                            compact: bool = False,
+                            **properties):
+    """
+    Write features as GeoJSON FeatureCollection to `path`.
+
+    :param precision: Number of decimal places to round coordinates to.
+    :param compact: Flag signaling whether to write JSON without indentation and whitespace.
+    """
+    if precision is not None:
+        # We must not alter the features in-place!
+        features = [
+            dict(f, geometry=rounded_geometry(f['geometry'], precision)) if f.get('geometry')
+            else f for f in features]
+    dump(
+        feature_collection(features, **properties),
+        path,
+        **(dict(separators=(',', ':')) if compact else dict(indent=2)))
@@ -0,0 +1,61 @@
+"""
+A compact index of the Glottolog languoid data used in this repository.
+
+Reading the Glottolog data from the INI files of the repository is slow, so we cache the relevant
+attributes per Glottolog version.
+"""
+import typing
+import pathlib
+import dataclasses
+
+from .cache import BuildCache
+
+
+@dataclasses.dataclass
+class Languoid:
+    """
+    Mirrors the subset of the `pyglottolog.languoids.Languoid` API we need.
+    """
+    id: str
+    name: str
+    level: str
+    latitude: typing.Optional[float]
+    longitude: typing.Optional[float]
+    lineage: typing.List[typing.Tuple[str, str, str]]  # (name, ID, level) triples, root first.
+
+    @classmethod
+    def from_glottolog(cls, lang):
+        return cls(
+            id=lang.id,
+            name=lang.name,
+            level=lang.level.id,
+            latitude=lang.latitude,
+            longitude=lang.longitude,
+            lineage=[(name, gc, level.id) for name, gc, level in lang.lineage],
+        )
+
+
+def catalog_version(catalog) -> typing.Optional[str]:
+    """
+    Identify the state of a catalog's repository, to be used as cache key.
+
+    :return: The output of `git describe`, or `None` if the catalog is not a git clone (e.g. a \
+    Zenodo export) or has uncommitted changes, i.e. if its state cannot be identified.
+    """
+    if not catalog.repo:
+        return None
+    version = catalog.repo.git.describe('--always', '--tags', '--dirty')
+    return None if version.endswith('-dirty') else version
+
+
+def languoids(catalog, cache_dir: pathlib.Path) -> typing.Dict[str, Languoid]:
+    """
+    :param catalog: `cldfcatalog.Catalog` for the Glottolog repository as passed in `args`.
+    :param cache_dir: Directory to store the index in.
+    :return: `dict` mapping Glottocodes to `Languoid` objects.
+    """
+    version = catalog_version(catalog)
+    return BuildCache(cache_dir, enabled=version is not None)(
+        'glottolog',
+        [version],
+        lambda: {lang.id: Languoid.from_glottolog(lang) for lang in catalog.api.languoids()})
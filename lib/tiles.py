@@ -0,0 +1,86 @@
+"""
+Support for web mercator XYZ tile pyramids.
+"""
+import math
+import typing
+import pathlib
+
+import shapely
+import numpy as np
+from PIL import Image
+
+from .util import existing_dir
+
+TILE_SIZE = 256
+
+
+def mercator(lon: float, lat: float) -> typing.Tuple[float, float]:
+    """
+    Project a coordinate to web mercator, normalized to [0, 1] with the origin in the north-west.
+    """
+    lat = max(min(lat, 85.0511), -85.0511)
+    siny = math.sin(math.radians(lat))
+    return (lon + 180) / 360, 0.5 - math.log((1 + siny) / (1 - siny)) / (4 * math.pi)
+
+
+def raster_tiles(img: pathlib.Path,
+                 bbox: typing.Tuple[float, float, float, float],
+                 out: pathlib.Path) -> typing.Tuple[int, int]:
+    """
+    Cut an image in web mercator projection into a pyramid of tiles `out/<z>/<x>/<y>.webp`.
+
+    We use WebP, because - unlike JPEG - it supports transparency for the tiles at the edges of
+    the image, while - unlike PNG - it compresses scans well.
+
+    :param img: Path of the image.
+    :param bbox: Bounding box of the image as (west, south, east, north) in degrees.
+    :return: Pair (minzoom, maxzoom) of zoom levels for which tiles have been created. `maxzoom` is \
+    the smallest zoom level at which the image is shown in its native resolution, `minzoom` is the \
+    zoom level at which the image fits on a single tile.
+    """
+    image = Image.open(img).convert('RGBA')
+    x1, y1 = mercator(bbox[0], bbox[3])
+    x2, y2 = mercator(bbox[2], bbox[1])
+    maxzoom = max(0, math.ceil(math.log2(image.width / (TILE_SIZE * (x2 - x1)))))
+    minzoom = min(maxzoom, max(0, math.floor(math.log2(1 / (x2 - x1)))))
+    for z in range(minzoom, maxzoom + 1):
+        n = 2 ** z
+        scaled = image.resize(
+            (max(1, round((x2 - x1) * n * TILE_SIZE)), max(1, round((y2 - y1) * n * TILE_SIZE))),
+            Image.LANCZOS)
+        left, top = x1 * n * TILE_SIZE, y1 * n * TILE_SIZE
+        for x in range(math.floor(x1 * n), math.ceil(x2 * n)):
+            for y in range(math.floor(y1 * n), math.ceil(y2 * n)):
+                # Cropping outside of the scaled image pads with transparent pixels.
+                tile = scaled.crop((
+                    round(x * TILE_SIZE - left),
+                    round(y * TILE_SIZE - top),
+                    round(x * TILE_SIZE - left) + TILE_SIZE,
+                    round(y * TILE_SIZE - top) + TILE_SIZE))
+                if tile.getbbox():  # Skip fully transparent tiles.
+                    tile.save(
+                        existing_dir(out / str(z) / str(x % n)) / '{}.webp'.format(y),
+                        quality=80)
+    return minzoom, maxzoom
+
+
+def mercator_geometry(geom):
+    """
+    Project a `shapely` geometry to web mercator, normalized to [0, 1] with the origin in the
+    south-west (i.e. with y-axis pointing up, as expected by MVT encoders).
+    """
+    def project(coords):
+        lon, lat = coords[:, 0], np.clip(coords[:, 1], -85.0511, 85.0511)
+        siny = np.sin(np.radians(lat))
+        return np.column_stack([
+            (lon + 180) / 360, 0.5 + np.log((1 + siny) / (1 - siny)) / (4 * math.pi)])
+
+    return shapely.transform(geom, project)
+
+
+def tile_bounds(z: int, x: int, y: int) -> typing.Tuple[float, float, float, float]:
+    """
+    Bounds of XYZ tile (z, x, y) in the coordinates returned by `mercator_geometry`.
+    """
+    n = 2 ** z
+    return x / n, 1 - (y + 1) / n, (x + 1) / n, 1 - y / n
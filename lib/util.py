@@ -1,3 +1,5 @@
+import os
+import shutil
 import itertools
 
 
@@ -8,6 +10,31 @@ def existing_dir(d):
     return d
 
 
+def build_option(name, default=None, type_=str):
+    """
+    `cldfbench makecldf` does not support dataset-specific command line options. Thus, options for
+    the CLDF creation are read from environment variables `LAOTPA_<NAME>`.
+    """
+    val = os.environ.get('LAOTPA_{}'.format(name.upper()))
+    if val is None:
+        return default
+    if type_ is bool:
+        return val.lower() in {'1', 'true', 'yes'}
+    return type_(val)
+
+
+def copy_if_changed(src, dst):
+    """
+    Copy `src` to `dst`, unless `dst` is a copy of the same version of `src` already.
+    """
+    if dst.exists():
+        s, d = src.stat(), dst.stat()
+        if s.st_size == d.st_size and s.st_mtime_ns == d.st_mtime_ns:
+            return dst
+    shutil.copy2(src, dst)
+    return dst
+
+
 class Fixer:
     """
     Class implementing support for book-keeping about things to fix, grouped by language name.
@@ -24,10 +24,14 @@ setup(
         'mako',
         'matplotlib',
         'tqdm',
+        'pillow',
     ],
     extras_require={
         'test': [
             'pytest-cldf',
         ],
+        'vectortiles': [
+            'mapbox-vector-tile',
+        ],
     },
 )
@@ -1,3 +1,10 @@
+from shapely.geometry import box, shape
+from pycldf import StructureDataset
+from cldfgeojson import aggregate as cldfgeojson_aggregate
+
+from lib.aggregate import aggregate
+from lib.glottolog import Languoid
+
 
 def test_valid(cldf_dataset, cldf_logger, cldf_sqlite_database):
     assert cldf_dataset.validate(log=cldf_logger)
@@ -10,3 +17,54 @@ def test_valid(cldf_dataset, cldf_logger, cldf_sqlite_database):
         'group by l.cldf_id having count(c.cldf_id) > 1 order by c desc limit 10;'
     )[0]
     assert res[0] == 'Austronesian' and res[1] >= 1259
+
+
+def test_aggregate(tmp_path):
+    # A toy Glottolog, with subgroups, dialects and isolates, ...
+    glottolog = [  # (Glottocode, name, level, lineage)
+        ('fam1', 'Family 1', 'family', []),
+        ('sub1', 'Subgroup 1', 'family', ['fam1']),
+        ('lan1', 'Language 1', 'language', ['fam1', 'sub1']),
+        ('dia1', 'Dialect 1', 'dialect', ['fam1', 'sub1', 'lan1']),
+        ('lan2', 'Language 2', 'language', ['fam1']),
+        ('iso1', 'Isolate', 'language', []),
+        ('fam2', 'Family 2', 'family', []),
+        ('lan3', 'Language 3', 'language', ['fam2']),
+    ]
+    names = {gc: name for gc, name, _, _ in glottolog}
+    glangs = {
+        gc: Languoid(gc, name, level, 1.0, 1.0, [(names[l], l, 'family') for l in lineage])
+        for gc, name, level, lineage in glottolog}
+    # ... also in glottolog-cldf format, as supported by cldfgeojson.aggregate:
+    ds = StructureDataset.in_dir(tmp_path)
+    ds.add_component('LanguageTable')
+    ds.add_columns('LanguageTable', 'Level')
+    ds.write(
+        LanguageTable=[
+            dict(ID=gc, Name=name, Level=level) for gc, name, level, _ in glottolog],
+        ValueTable=[
+            dict(ID=gc, Language_ID=gc, Parameter_ID='classification', Value='/'.join(lineage))
+            for gc, _, _, lineage in glottolog if lineage])
+
+    shapes = [
+        (str(i),
+         dict(type='Feature', properties={}, geometry=box(i, 0, i + 0.9, 1).__geo_interface__),
+         gc)
+        for i, gc in enumerate(['lan1', 'dia1', 'lan2', 'sub1', 'iso1', 'lan3', 'lan3', 'lan2'])]
+    shapes.append(('0', shapes[0][1], 'lan2'))  # A shape mapped to two languages.
+
+    res = aggregate(shapes, glangs, buffer=0.005, opacity=0.5)
+    for level in ['language', 'family']:
+        features, languoids = res[level]
+        expected_features, expected_languoids = cldfgeojson_aggregate(
+            shapes, ds, level=level, buffer=0.005, opacity=0.5)
+        assert [(l.id, l.name, pids, fam) for l, pids, fam in languoids] == \
+            [(l.id, l.name, pids, fam) for l, pids, fam in expected_languoids]
+        assert [f['properties'] for f in features] == \
+            [f['properties'] for f in expected_features]
+        for f, ef in zip(features, expected_features):
+            if level == 'language':
+                assert shape(f['geometry']).equals(shape(ef['geometry']))
+            else:  # Family areas are merged from merged language areas, so may differ slightly.
+                assert shape(f['geometry']).symmetric_difference(
+                    shape(ef['geometry'])).area < 1e-6